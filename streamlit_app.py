@@ -1,7 +1,15 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 from pathlib import Path
+from collections import OrderedDict
+import functools
+import hmac
+import os
+import pickle
+import threading
+import time
 import openpyxl
 
 # -----------------------------------------------------------------------------
@@ -50,11 +58,138 @@ REGION_COORDINATES = {
     '경남': (35.2383, 128.6925), '제주': (33.4996, 126.5312)
 }
 
+# 차트 렌더링 설정: 데이터 단위가 도서관/시군구로 세분화되어도 전송량이 일정하도록 제한
+RENDER_WEBGL_THRESHOLD = 1000  # 산점/라인 포인트 합계가 이 값을 넘으면 WebGL(scattergl)로 전환
+RENDER_MAX_POINTS = 2000       # 화면 해상도 대비 최대 표시 포인트 수 (초과 시 서버에서 구간 집계)
+
+# 캐시 설정: 고정 메모리 컨테이너에서도 안전하도록 전체 캐시 메모리에 상한을 둡니다 (환경 변수로 조정 가능)
+CACHE_MAX_MEMORY_MB = float(os.environ.get('DASHBOARD_CACHE_MAX_MB', '512'))
+# 관리자 비밀번호가 설정된 경우에만 사이드바에서 캐시 초기화/재구성 기능을 사용할 수 있습니다.
+ADMIN_PASSWORD = os.environ.get('DASHBOARD_ADMIN_PASSWORD', '')
+
+
+# -----------------------------------------------------------------------------
+# 1-1. 캐시 저장소 (메모리 상한 + LRU 축출 + 적중률 통계)
+# -----------------------------------------------------------------------------
+@st.cache_resource
+def get_cache_store():
+    # 서버 프로세스 전체(모든 세션)에서 공유되는 단일 저장소
+    return {
+        'entries': OrderedDict(),  # key -> {'name', 'value', 'size', 'hits', 'created', 'last_access'}
+        'stats': {},               # name -> {'hits', 'misses', 'evictions'}
+        'versions': {},            # name -> 계산 횟수 (의존하는 캐시의 키에 포함해 데이터 세대를 구분)
+        'key_locks': {},           # key -> 같은 키의 동시 계산을 막는 잠금
+        'lock': threading.Lock(),
+    }
+
+
+def estimate_size(value):
+    # DataFrame은 실제 메모리 사용량, 그 외 객체는 직렬화 크기로 근사합니다.
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, tuple):
+        return sum(estimate_size(v) for v in value)
+    try:
+        return len(pickle.dumps(value))
+    except Exception:
+        return 0
+
+
+def copy_cached_value(value):
+    # st.cache_data와 마찬가지로 세션마다 복사본을 돌려주어, 호출 측에서 수정해도 캐시 원본은 변하지 않습니다.
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(copy_cached_value(v) for v in value)
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+def release_key_lock(store, key):
+    # 계산 중이 아닌 키의 잠금만 정리합니다 (store['lock']을 잡은 상태에서 호출).
+    key_lock = store['key_locks'].get(key)
+    if key_lock is not None and not key_lock.locked():
+        del store['key_locks'][key]
+
+
+def evict_until_within_limit(store):
+    # 가장 오래 사용되지 않은 항목부터 제거합니다. 방금 저장한 최신 항목 하나는 항상 유지합니다.
+    limit = CACHE_MAX_MEMORY_MB * 1024 * 1024
+    entries = store['entries']
+    while len(entries) > 1 and sum(e['size'] for e in entries.values()) > limit:
+        evicted_key, evicted = entries.popitem(last=False)
+        store['stats'][evicted['name']]['evictions'] += 1
+        release_key_lock(store, evicted_key)
+
+
+def bounded_cache(name):
+    # st.cache_data 대신 사용하는 메모리 상한형 LRU 캐시 데코레이터
+    # - 인자는 해시 가능해야 하며, '_'로 시작하는 키워드 인자는 st.cache_data처럼 캐시 키에서 제외됩니다.
+    # - 같은 키는 키별 잠금으로 한 번만 계산되고, 반환값은 복사본이므로 호출 측에서 수정해도 안전합니다.
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            store = get_cache_store()
+            key_kwargs = tuple(sorted((k, v) for k, v in kwargs.items() if not k.startswith('_')))
+            key = (name, args, key_kwargs)
+            with store['lock']:
+                key_lock = store['key_locks'].setdefault(key, threading.Lock())
+
+            # 다른 세션이 같은 키를 계산 중이면 기다렸다가 그 결과를 적중으로 사용합니다.
+            try:
+                with key_lock:
+                    with store['lock']:
+                        stats = store['stats'].setdefault(name, {'hits': 0, 'misses': 0, 'evictions': 0})
+                        entry = store['entries'].get(key)
+                        if entry is not None:
+                            store['entries'].move_to_end(key)
+                            entry['hits'] += 1
+                            entry['last_access'] = time.time()
+                            stats['hits'] += 1
+                            return copy_cached_value(entry['value'])
+                        stats['misses'] += 1
+
+                    value = func(*args, **kwargs)
+                    now = time.time()
+                    with store['lock']:
+                        store['entries'][key] = {
+                            'name': name, 'value': value, 'size': estimate_size(value),
+                            'hits': 0, 'created': now, 'last_access': now
+                        }
+                        store['versions'][name] = store['versions'].get(name, 0) + 1
+                        evict_until_within_limit(store)
+            except Exception:
+                # 계산이 실패하면 항목 없이 남은 키 잠금을 정리합니다 (키 잠금이 풀린 뒤에만 정리할 수 있음).
+                with store['lock']:
+                    release_key_lock(store, key)
+                raise
+            return copy_cached_value(value)
+        return wrapper
+    return decorator
+
+
+def cache_version(name):
+    # 해당 캐시가 지금까지 계산된 횟수 (다시 계산될 때마다 증가하므로 데이터 세대 번호로 사용)
+    store = get_cache_store()
+    with store['lock']:
+        return store['versions'].get(name, 0)
+
+
+def clear_cache():
+    # 모든 캐시 항목을 비웁니다 (누적 통계는 유지).
+    store = get_cache_store()
+    with store['lock']:
+        keys = list(store['entries'])
+        store['entries'].clear()
+        for key in keys:
+            release_key_lock(store, key)
+
 
 # -----------------------------------------------------------------------------
 # 2. 데이터 로드 및 전처리 함수 (파일 경로 및 오류 처리 강화)
 # -----------------------------------------------------------------------------
-@st.cache_data
+@bounded_cache('dataset')
 def load_and_process_data():
     # 파일 목록 정의 (파일 이름은 기존 코드와 동일하게 유지)
     files = [
@@ -68,6 +203,8 @@ def load_and_process_data():
     # data 폴더와 현재 폴더를 모두 탐색합니다.
     data_dir = Path("data")
     all_data = []
+    # 경고/오류 메시지는 캐시 적중 시에도 다시 표시할 수 있도록 결과와 함께 반환합니다.
+    messages = []
     target_subjects = ['총류', '철학', '종교', '사회과학', '순수과학', '기술과학', '예술', '언어', '문학', '역사']
     target_ages = ['어린이', '청소년', '성인']
 
@@ -86,7 +223,7 @@ def load_and_process_data():
             file_to_use = file_path_current
 
         if not file_to_use:
-            st.warning(f"**[파일 누락 경고]** {item['year']}년 데이터 파일 '{file_name}'을(를) 'data/' 또는 현재 폴더에서 찾을 수 없습니다. 이 연도의 데이터는 분석에서 제외됩니다.")
+            messages.append(('warning', f"**[파일 누락 경고]** {item['year']}년 데이터 파일 '{file_name}'을(를) 'data/' 또는 현재 폴더에서 찾을 수 없습니다. 이 연도의 데이터는 분석에서 제외됩니다."))
             continue
 
         try:
@@ -116,11 +253,11 @@ def load_and_process_data():
                 df = df[summary_filter].reset_index(drop=True)
                 # -------------------------------------------------------------
             else:
-                st.error(f"**[처리 오류]** {item['year']}년 파일 '{file_name}'의 4번째 컬럼(index 3)에서 지역 데이터를 찾을 수 없습니다. 파일 구조를 확인해 주세요.")
+                messages.append(('error', f"**[처리 오류]** {item['year']}년 파일 '{file_name}'의 4번째 컬럼(index 3)에서 지역 데이터를 찾을 수 없습니다. 파일 구조를 확인해 주세요."))
                 continue
 
         except Exception as e:
-            st.error(f"**[파일 로드 오류]** {item['year']}년 파일 '{file_name}'을(를) 로드하거나 처리하는 중 예외가 발생했습니다: {e}")
+            messages.append(('error', f"**[파일 로드 오류]** {item['year']}년 파일 '{file_name}'을(를) 로드하거나 처리하는 중 예외가 발생했습니다: {e}"))
             continue
         
         extracted_rows = []
@@ -157,10 +294,10 @@ def load_and_process_data():
             year_df = pd.DataFrame(extracted_rows)
             all_data.append(year_df)
         else:
-             st.warning(f"**[데이터 추출 경고]** {item['year']}년 파일 '{file_name}'에서 유효한 대출 데이터를 추출하지 못했습니다. 컬럼 이름을 확인해 주세요.")
+             messages.append(('warning', f"**[데이터 추출 경고]** {item['year']}년 파일 '{file_name}'에서 유효한 대출 데이터를 추출하지 못했습니다. 컬럼 이름을 확인해 주세요."))
 
 
-    if not all_data: return pd.DataFrame()
+    if not all_data: return pd.DataFrame(), messages
         
     final_df = pd.concat(all_data, ignore_index=True)
     final_df['Count_Unit'] = final_df['Count'] / UNIT_DIVISOR
@@ -182,19 +319,169 @@ def load_and_process_data():
     final_df['Longitude'] = final_df['Region'].map(lambda x: REGION_COORDINATES.get(x, (None, None))[1])
 
 
-    return final_df
+    return final_df, messages
+
+
+# 지도 시각화용 연도별 지역 집계 (차트 단위 캐시)
+# dataset_version으로 원본 데이터 세대를 구분하고, 이미 로드된 _data를 받아 데이터셋 캐시를 다시 조회하지 않습니다.
+@bounded_cache('map_data')
+def build_map_data(year, dataset_version, _data):
+    map_data = _data[_data['Year'] == year].groupby('Region').agg({
+        'Count_Unit': 'sum',
+        'Latitude': 'first',
+        'Longitude': 'first'
+    }).reset_index()
+    # 지점 수가 화면 해상도를 넘으면 위경도 격자 단위로 묶어 버블 수를 제한
+    return downsample_points(map_data, ['Latitude', 'Longitude'], value_col='Count_Unit', label_col='Region')
+
+# -----------------------------------------------------------------------------
+# 2-1. 차트 페이로드 경량화 함수 (다운샘플링, WebGL 전환, 메타데이터 정리)
+# -----------------------------------------------------------------------------
+def downsample_points(data, bin_cols, value_col=None, label_col=None, max_points=RENDER_MAX_POINTS):
+    # 포인트 수가 max_points 이하이면 원본을 그대로 사용합니다.
+    if len(data) <= max_points:
+        return data
+    # 구간 대상 컬럼은 평균(좌표), 값 컬럼은 합계로 집계하므로 같은 컬럼을 둘 다에 지정할 수 없습니다.
+    if value_col in bin_cols:
+        raise ValueError(f"value_col '{value_col}'은(는) bin_cols에 포함될 수 없습니다.")
+
+    # 축당 구간 수: bins ** 축 개수 + 1(결측 좌표 묶음)이 max_points를 넘지 않도록 정합니다.
+    # 따라서 원본 데이터가 아무리 세분화되어도 결과 포인트 수는 항상 max_points 이하입니다 (max_points >= 2).
+    bins = max(1, int((max_points - 1) ** (1 / len(bin_cols))))
+
+    binned = data.copy()
+    keys = []
+    for col in bin_cols:
+        bin_col = f'{col}_Bin'
+        binned[bin_col] = pd.cut(binned[col], bins=bins, labels=False)
+        keys.append(bin_col)
+    # 좌표가 하나라도 비어 있는 행은 구간 조합을 늘리지 않도록 하나의 묶음(-1)으로 모읍니다.
+    binned.loc[binned[keys].isna().any(axis=1), keys] = -1
+
+    # 좌표(구간 대상 컬럼)는 평균, 값은 합계, 라벨은 대표값으로 집계합니다.
+    agg_spec = {col: (col, 'mean') for col in bin_cols}
+    if value_col:
+        agg_spec[value_col] = (value_col, 'sum')
+    if label_col:
+        agg_spec[label_col] = (label_col, 'first')
+    agg_spec['Point_Count'] = (bin_cols[0], 'size')
+
+    result = binned.groupby(keys).agg(**agg_spec).reset_index(drop=True)
+
+    if label_col:
+        merged = result['Point_Count'] > 1
+        result.loc[merged, label_col] = (
+            result.loc[merged, label_col].astype(str) + ' 외 ' + (result.loc[merged, 'Point_Count'] - 1).astype(str) + '곳'
+        )
+    return result
+
+
+def compact_figure(fig):
+    # 1. 포인트가 많으면 SVG 대신 WebGL 트레이스로 전환 (영역 차트의 stackgroup은 WebGL 미지원이므로 제외)
+    point_count = sum(len(trace.x) for trace in fig.data if trace.type == 'scatter' and trace.x is not None)
+    if point_count > RENDER_WEBGL_THRESHOLD:
+        traces = []
+        for trace in fig.data:
+            if trace.type == 'scatter' and trace.stackgroup is None:
+                trace_spec = trace.to_plotly_json()
+                trace_spec.pop('type', None)
+                # orientation은 stackgroup이 있을 때만 의미가 있으므로(위에서 제외) 제거해도 모양이 같습니다.
+                trace_spec.pop('orientation', None)
+                try:
+                    trace = go.Scattergl(trace_spec)
+                except ValueError:
+                    # spline 곡선 등 scattergl이 지원하지 않는 속성이 있으면 모양 유지를 위해 SVG로 둡니다.
+                    pass
+            traces.append(trace)
+        fig = go.Figure(data=traces, layout=fig.layout)
+
+    # 2. 템플릿에 포함된 미사용 트레이스 유형의 기본 스타일을 제거 (실제 사용하는 유형만 전송)
+    used_types = {trace.type for trace in fig.data}
+    template_data = fig.layout.template.data.to_plotly_json()
+    fig.layout.template.data = {k: v for k, v in template_data.items() if k in used_types}
+    return fig
+
+
+def render_plotly_chart(fig):
+    # 모든 차트는 경량화 과정을 거친 뒤 출력합니다.
+    st.plotly_chart(compact_figure(fig), use_container_width=True)
 
 # -----------------------------------------------------------------------------
 # 3. 데이터 로드 실행
 # -----------------------------------------------------------------------------
 with st.spinner(f'5개년 엑셀 파일 정밀 분석 및 데이터 통합 중 (단위: {UNIT_LABEL} 적용)...'):
-    df = load_and_process_data()
+    df, load_messages = load_and_process_data()
+
+for level, message in load_messages:
+    if level == 'error':
+        st.error(message)
+    else:
+        st.warning(message)
+
+# -----------------------------------------------------------------------------
+# 3-1. 캐시 관리 (사이드바: 적중률/메모리 현황, 관리자 전용 데이터 재구성)
+# -----------------------------------------------------------------------------
+def render_cache_panel():
+    # 차트 생성이 끝난 뒤 호출해야 이번 실행의 적중/미적중이 반영됩니다.
+    with st.sidebar.expander("🛠 캐시 관리", expanded=False):
+        store = get_cache_store()
+        with store['lock']:
+            cache_stats = {name: dict(values) for name, values in store['stats'].items()}
+            cache_entries = [
+                {
+                    '캐시': e['name'],
+                    '키': ', '.join(str(arg) for arg in key[1]) or '-',
+                    '크기(MB)': round(e['size'] / 1024 / 1024, 2),
+                    '적중': e['hits'],
+                    '마지막 사용': time.strftime('%H:%M:%S', time.localtime(e['last_access']))
+                }
+                for key, e in store['entries'].items()
+            ]
+            total_mb = sum(e['size'] for e in store['entries'].values()) / 1024 / 1024
+
+        total_hits = sum(v['hits'] for v in cache_stats.values())
+        total_misses = sum(v['misses'] for v in cache_stats.values())
+        hit_rate = total_hits / (total_hits + total_misses) * 100 if (total_hits + total_misses) > 0 else 0
+
+        col_hit, col_miss = st.columns(2)
+        col_hit.metric("적중", f"{total_hits:,}")
+        col_miss.metric("미적중", f"{total_misses:,}")
+        st.metric("적중률", f"{hit_rate:.1f}%")
+        st.metric("사용 메모리", f"{total_mb:,.1f} / {CACHE_MAX_MEMORY_MB:,.1f} MB")
+        st.progress(min(total_mb / CACHE_MAX_MEMORY_MB, 1.0) if CACHE_MAX_MEMORY_MB > 0 else 0.0)
+
+        if cache_stats:
+            st.dataframe(
+                pd.DataFrame([{'캐시': name, **values} for name, values in cache_stats.items()]).rename(
+                    columns={'hits': '적중', 'misses': '미적중', 'evictions': '축출'}
+                ),
+                hide_index=True
+            )
+        if cache_entries:
+            st.dataframe(pd.DataFrame(cache_entries), hide_index=True)
+
+        # 관리자 전용: 서버 재시작 없이 데이터셋 캐시를 비우고 다시 구성합니다.
+        if ADMIN_PASSWORD:
+            admin_input = st.text_input("관리자 비밀번호", type="password", key='cache_admin_password')
+            # str끼리 비교하면 한글 등 비ASCII 문자에서 TypeError가 나므로 UTF-8 바이트로 비교합니다.
+            if admin_input and hmac.compare_digest(admin_input.encode('utf-8'), ADMIN_PASSWORD.encode('utf-8')):
+                if st.button("데이터셋 캐시 초기화 및 재구성", key='cache_rebuild'):
+                    clear_cache()
+                    with st.spinner("데이터셋을 다시 구성하는 중..."):
+                        load_and_process_data()
+                    st.rerun()
+            elif admin_input:
+                st.error("관리자 비밀번호가 올바르지 않습니다.")
+        else:
+            st.caption("`DASHBOARD_ADMIN_PASSWORD` 환경 변수를 설정하면 캐시 재구성 기능을 사용할 수 있습니다.")
+
 
 # -----------------------------------------------------------------------------
 # 4. 시각화 시작
 # -----------------------------------------------------------------------------
 if df.empty:
     st.error("데이터를 추출하지 못했습니다. 위쪽의 **[파일 누락 경고]** 또는 **[파일 로드 오류]** 메시지를 확인하여 파일 경로와 구조를 점검해 주세요.")
+    render_cache_panel()
     st.stop()
 
 base_df = df.copy()
@@ -250,7 +537,7 @@ fig_overall_line.update_yaxes(
 )
 # <<< Y축 범위 조정 적용 끝 >>>
 
-st.plotly_chart(fig_overall_line, use_container_width=True)
+render_plotly_chart(fig_overall_line)
 
 st.markdown("---")
 
@@ -291,7 +578,7 @@ else:
     )
     fig_region_line.update_xaxes(type='category')
     fig_region_line.update_yaxes(tickformat=',.0f')
-    st.plotly_chart(fig_region_line, use_container_width=True)
+    render_plotly_chart(fig_region_line)
     
 st.markdown("---")
     
@@ -331,7 +618,7 @@ else:
 
     fig_mat.update_xaxes(type='category')
     fig_mat.update_yaxes(tickformat=',.0f')
-    st.plotly_chart(fig_mat, use_container_width=True)
+    render_plotly_chart(fig_mat)
         
 st.markdown("---")
 
@@ -373,7 +660,7 @@ else:
     )
     fig_age_bar.update_xaxes(type='category')
     fig_age_bar.update_yaxes(tickformat=',.0f')
-    st.plotly_chart(fig_age_bar, use_container_width=True)
+    render_plotly_chart(fig_age_bar)
 st.markdown("---")
 
 
@@ -415,7 +702,7 @@ else:
     )
     fig_subject_line.update_xaxes(type='category')
     fig_subject_line.update_yaxes(tickformat=',.0f')
-    st.plotly_chart(fig_subject_line, use_container_width=True)
+    render_plotly_chart(fig_subject_line)
 st.markdown("---")
 
 
@@ -453,11 +740,7 @@ if not detail_data.empty:
     st.markdown(f"### {target_year}년 지역별 대출 권수 지도 시각화")
 
     # 7-1. 데이터 준비 (지역별 총 대출 권수 합산)
-    map_data = base_df[base_df['Year'] == target_year].groupby('Region').agg({
-        'Count_Unit': 'sum',
-        'Latitude': 'first',
-        'Longitude': 'first'
-    }).reset_index()
+    map_data = build_map_data(target_year, cache_version('dataset'), _data=base_df)
 
     if map_data.empty or map_data['Latitude'].isnull().any():
         st.warning("지도 시각화를 위한 지역별 데이터 또는 좌표가 부족합니다.")
@@ -504,7 +787,7 @@ if not detail_data.empty:
             selector=dict(mode='markers')
         )
 
-        st.plotly_chart(fig_map, use_container_width=True)
+        render_plotly_chart(fig_map)
     st.markdown("---") # 지도 시각화 끝
     
     
@@ -556,7 +839,7 @@ if not detail_data.empty:
         # Y축 포맷 변경: 비율(%)에서 권수(쉼표 포맷)로 변경
         fig_bar_preference.update_yaxes(tickformat=',.0f') 
         fig_bar_preference.update_layout(height=500, xaxis_title='지역', yaxis_title=f'대출 권수 ({UNIT_LABEL})')
-        st.plotly_chart(fig_bar_preference, use_container_width=True)
+        render_plotly_chart(fig_bar_preference)
     st.markdown("---")
 
 
@@ -607,7 +890,7 @@ if not detail_data.empty:
         opacity=0.8
     )
 
-    st.plotly_chart(fig_multi_scatter, use_container_width=True)
+    render_plotly_chart(fig_multi_scatter)
     st.markdown("---")
 
     # -------------------------------------------------------------------------
@@ -671,10 +954,12 @@ if not detail_data.empty:
                     legend=dict(orientation="h", yanchor="bottom", y=-0.1, xanchor="center", x=0.5)
                 )
 
-                st.plotly_chart(fig_pie_age, use_container_width=True)
+                render_plotly_chart(fig_pie_age)
 
 # -------------------------------------------------------------
 # 7. 지역별 대출 권수 지도 시각화 (기존 코드는 섹션 6으로 이동됨)
 # -------------------------------------------------------------
 
 st.markdown("---")
+
+render_cache_panel()